@@ -20,6 +20,7 @@ class Settings(BaseSettings):
     DEFAULT_HEIGHT: int = 512
     DEFAULT_STEPS: int = 9  # Results in 8 DiT forwards for Turbo
     DEFAULT_GUIDANCE_SCALE: float = 0.0  # Must be 0 for Turbo models
+    MAX_BATCH_SIZE: int = 16  # Max images per batch request
 
     # ── CPU Optimization ────────────────────────────────────────────
     NUM_THREADS: int = 0  # 0 = auto-detect (all cores)
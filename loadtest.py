@@ -0,0 +1,495 @@
+"""
+Load-testing harness for the Z-Image Turbo server.
+
+Starts the real FastAPI app (REST API + MCP mount) in a background thread with
+a fake pipeline of configurable latency, then drives mixed concurrent traffic:
+REST generates and batches, gallery polling, image fetches and MCP tool calls.
+Reports throughput, tail latency, rejection rate and server event-loop lag,
+and saves the results as JSON for comparison across commits.
+
+Usage:
+    python loadtest.py --duration 30 --generate-clients 2 --mcp-clients 2
+    python loadtest.py --batch-clients 1 --mcp-batch-clients 1 --batch-size 4
+    python loadtest.py --latency 1.5 --jitter 0.5 --distribution lognormal
+    python loadtest.py --compare loadtest_results/<previous>.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+import uvicorn
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+from PIL import Image
+from termcolor import colored
+
+from config import SETTINGS
+from main import APP
+from services.model_manager import MODEL_MANAGER
+
+
+RESULTS_DIR = "loadtest_results"
+LAG_INTERVAL = 0.01  # Event-loop lag sampling period in seconds
+
+
+# ── Fake Pipeline ────────────────────────────────────────────────
+
+
+class FakePipeline:
+    """Stand-in for ZImagePipeline that sleeps instead of running inference."""
+
+    device = "cpu"
+
+    def __init__(self, latency: float, jitter: float, distribution: str) -> None:
+        self._latency = latency
+        self._jitter = jitter
+        self._distribution = distribution
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    def _sample_latency(self) -> float:
+        """Draw one inference latency from the configured distribution."""
+        with self._lock:
+            if self._distribution == "uniform":
+                VALUE = self._random.uniform(
+                    self._latency - self._jitter, self._latency + self._jitter
+                )
+            elif self._distribution == "normal":
+                VALUE = self._random.gauss(self._latency, self._jitter)
+            elif self._distribution == "lognormal":
+                # Parameterised so the mean is `latency` and the stddev `jitter`
+                SIGMA_SQ = math.log(1 + (self._jitter / self._latency) ** 2)
+                MU = math.log(self._latency) - SIGMA_SQ / 2
+                VALUE = self._random.lognormvariate(MU, math.sqrt(SIGMA_SQ))
+            else:
+                VALUE = self._latency
+        return max(0.0, VALUE)
+
+    def encode_prompt(self, prompt, device=None, do_classifier_free_guidance=True):
+        return [prompt], []
+
+    def __call__(self, height: int, width: int, **kwargs):
+        time.sleep(self._sample_latency())
+        return types.SimpleNamespace(images=[Image.new("RGB", (width, height))])
+
+
+def install_fake_pipeline(latency: float, jitter: float, distribution: str) -> None:
+    """Mark the model as loaded with a fake pipeline so startup skips loading."""
+    MODEL_MANAGER._pipeline = FakePipeline(latency, jitter, distribution)
+    MODEL_MANAGER._is_loaded = True
+
+
+# ── Server ───────────────────────────────────────────────────────
+
+
+class ServerThread(threading.Thread):
+    """Runs uvicorn on its own event loop and samples that loop's lag."""
+
+    def __init__(self, port: int) -> None:
+        super().__init__(daemon=True)
+        self.server = uvicorn.Server(uvicorn.Config(
+            APP, host="127.0.0.1", port=port, log_level="warning",
+        ))
+        self.lag_samples: list[float] = []
+        self.sampling = False
+
+    async def _monitor_lag(self) -> None:
+        """Measure how late the loop wakes from a short sleep."""
+        while True:
+            START = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            if self.sampling:
+                self.lag_samples.append(time.perf_counter() - START - LAG_INTERVAL)
+
+    async def _serve(self) -> None:
+        MONITOR = asyncio.create_task(self._monitor_lag())
+        try:
+            await self.server.serve()
+        finally:
+            MONITOR.cancel()
+
+    def run(self) -> None:
+        asyncio.run(self._serve())
+
+    def wait_started(self, timeout: float = 30.0) -> None:
+        DEADLINE = time.time() + timeout
+        while not self.server.started:
+            if not self.is_alive() or time.time() > DEADLINE:
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.join(timeout=30)
+
+
+def _free_port() -> int:
+    with socket.socket() as SOCK:
+        SOCK.bind(("127.0.0.1", 0))
+        return SOCK.getsockname()[1]
+
+
+# ── Traffic ──────────────────────────────────────────────────────
+
+
+class Recorder:
+    """Collects per-operation outcomes and latencies."""
+
+    def __init__(self) -> None:
+        self.ops: dict[str, dict] = {}
+
+    def record(self, op: str, outcome: str, latency: float) -> None:
+        OP = self.ops.setdefault(op, {"ok": [], "rejected": 0, "errors": 0})
+        if outcome == "ok":
+            OP["ok"].append(latency)
+        elif outcome == "rejected":
+            OP["rejected"] += 1
+        else:
+            OP["errors"] += 1
+
+
+def _http_outcome(response: httpx.Response) -> str:
+    if response.status_code == 429:
+        return "rejected"
+    return "ok" if response.is_success else "error"
+
+
+async def _timed(recorder: Recorder, op: str, coro) -> Optional[object]:
+    """Await a request coroutine and record its outcome and latency."""
+    START = time.perf_counter()
+    try:
+        RESULT = await coro
+    except Exception:
+        recorder.record(op, "error", time.perf_counter() - START)
+        return None
+    OUTCOME = _http_outcome(RESULT) if isinstance(RESULT, httpx.Response) else RESULT[0]
+    recorder.record(op, OUTCOME, time.perf_counter() - START)
+    return RESULT
+
+
+async def generate_worker(client, recorder, deadline, args) -> None:
+    """Closed-loop REST generate client; backs off briefly after a 429."""
+    while time.time() < deadline:
+        RESPONSE = await _timed(recorder, "generate", client.post(
+            "/api/generate",
+            json={"prompt": "load test", "width": args.size, "height": args.size},
+        ))
+        if RESPONSE is None or RESPONSE.status_code != 200:
+            await asyncio.sleep(args.retry_interval)
+
+
+async def poll_worker(client, recorder, deadline, args, filenames) -> None:
+    """Gallery polling client, like the frontend refreshing the carousel."""
+    while time.time() < deadline:
+        RESPONSE = await _timed(recorder, "poll", client.get("/api/images"))
+        if RESPONSE is not None and RESPONSE.status_code == 200:
+            filenames[:] = [IMG["filename"] for IMG in RESPONSE.json()]
+        await asyncio.sleep(args.poll_interval)
+
+
+async def fetch_worker(client, recorder, deadline, args, filenames) -> None:
+    """Fetches full image files that the gallery currently lists."""
+    while time.time() < deadline:
+        if filenames:
+            await _timed(recorder, "fetch", client.get(
+                f"/api/images/{random.choice(filenames)}"
+            ))
+        await asyncio.sleep(args.fetch_interval)
+
+
+async def batch_worker(client, recorder, deadline, args) -> None:
+    """Closed-loop REST batch client; also records time to the first streamed item."""
+
+    async def _call():
+        START = time.perf_counter()
+        async with client.stream("POST", "/api/generate/batch", json={
+            "prompt": "load test", "count": args.batch_size,
+            "width": args.size, "height": args.size,
+        }) as RESPONSE:
+            if RESPONSE.status_code != 200:
+                return (_http_outcome(RESPONSE), None)
+            LAST = None
+            async for LINE in RESPONSE.aiter_lines():
+                if not LINE:
+                    continue
+                LAST = json.loads(LINE)
+                if LAST["type"] == "item" and LAST["index"] == 0:
+                    recorder.record("batch_first", "ok", time.perf_counter() - START)
+            return ("ok" if LAST and LAST["type"] == "done" else "error", LAST)
+
+    while time.time() < deadline:
+        RESULT = await _timed(recorder, "batch", _call())
+        if RESULT is None or RESULT[0] != "ok":
+            await asyncio.sleep(args.retry_interval)
+
+
+async def mcp_worker(base_url, recorder, deadline, args, op, tool, arguments) -> None:
+    """MCP client repeatedly calling one tool over streamable HTTP."""
+
+    async def _call(session):
+        RESULT = await session.call_tool(tool, arguments)
+        TEXT = RESULT.content[0].text if RESULT.content else ""
+        if RESULT.isError or '"error"' in TEXT:
+            return ("rejected" if '"busy": true' in TEXT else "error", TEXT)
+        return ("ok", TEXT)
+
+    try:
+        async with streamablehttp_client(f"{base_url}{SETTINGS.MCP_PATH}/") as (READ, WRITE, _):
+            async with ClientSession(READ, WRITE) as SESSION:
+                await SESSION.initialize()
+                while time.time() < deadline:
+                    RESULT = await _timed(recorder, op, _call(SESSION))
+                    if RESULT is None or RESULT[0] != "ok":
+                        await asyncio.sleep(args.retry_interval)
+    except Exception as e:
+        recorder.record(f"{op}_session", "error", 0.0)
+        print(colored(f"[LoadTest] MCP session failed: {e}", "red"), file=sys.stderr)
+
+
+async def run_traffic(base_url: str, args) -> tuple[Recorder, float]:
+    """Run all clients until the duration elapses; return recorder and wall time."""
+    RECORDER = Recorder()
+    FILENAMES: list[str] = []
+    DEADLINE = time.time() + args.duration
+    REST_CLIENTS = (
+        args.generate_clients + args.batch_clients + args.poll_clients + args.fetch_clients
+    )
+    IMAGE_ARGS = {"prompt": "load test", "width": args.size, "height": args.size}
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=args.timeout,
+        limits=httpx.Limits(max_connections=max(1, REST_CLIENTS)),
+    ) as CLIENT:
+        WORKERS = (
+            [generate_worker(CLIENT, RECORDER, DEADLINE, args) for _ in range(args.generate_clients)]
+            + [batch_worker(CLIENT, RECORDER, DEADLINE, args) for _ in range(args.batch_clients)]
+            + [poll_worker(CLIENT, RECORDER, DEADLINE, args, FILENAMES) for _ in range(args.poll_clients)]
+            + [fetch_worker(CLIENT, RECORDER, DEADLINE, args, FILENAMES) for _ in range(args.fetch_clients)]
+            + [
+                mcp_worker(base_url, RECORDER, DEADLINE, args, "mcp", "generate_image", IMAGE_ARGS)
+                for _ in range(args.mcp_clients)
+            ]
+            + [
+                mcp_worker(
+                    base_url, RECORDER, DEADLINE, args, "mcp_batch", "generate_images",
+                    {**IMAGE_ARGS, "count": args.batch_size},
+                )
+                for _ in range(args.mcp_batch_clients)
+            ]
+        )
+        START = time.perf_counter()
+        await asyncio.gather(*WORKERS)
+        return RECORDER, time.perf_counter() - START
+
+
+# ── Reporting ────────────────────────────────────────────────────
+
+
+def _percentile(values: list[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, in milliseconds."""
+    if not values:
+        return None
+    ORDERED = sorted(values)
+    INDEX = max(0, math.ceil(pct / 100 * len(ORDERED)) - 1)
+    return round(ORDERED[INDEX] * 1000, 2)
+
+
+def summarize(recorder: Recorder, lag_samples: list[float], wall_time: float) -> dict:
+    """Reduce raw samples to throughput, tail latency, rejection and lag stats."""
+    OPS = {}
+    for NAME, OP in sorted(recorder.ops.items()):
+        TOTAL = len(OP["ok"]) + OP["rejected"] + OP["errors"]
+        OPS[NAME] = {
+            "requests": TOTAL,
+            "ok": len(OP["ok"]),
+            "rejected": OP["rejected"],
+            "errors": OP["errors"],
+            "throughput_rps": round(len(OP["ok"]) / wall_time, 3),
+            "rejection_rate": round(OP["rejected"] / TOTAL, 4) if TOTAL else 0.0,
+            "p50_ms": _percentile(OP["ok"], 50),
+            "p90_ms": _percentile(OP["ok"], 90),
+            "p99_ms": _percentile(OP["ok"], 99),
+            "max_ms": _percentile(OP["ok"], 100),
+        }
+    return {
+        "wall_time_seconds": round(wall_time, 2),
+        "operations": OPS,
+        "event_loop_lag": {
+            "samples": len(lag_samples),
+            "p50_ms": _percentile(lag_samples, 50),
+            "p99_ms": _percentile(lag_samples, 99),
+            "max_ms": _percentile(lag_samples, 100),
+        },
+    }
+
+
+def print_report(summary: dict, baseline: Optional[dict] = None) -> None:
+    """Print a table of results, with deltas against a baseline if given."""
+
+    def _delta(new, old, higher_is_better: bool = False) -> str:
+        if new is None or old is None:
+            return ""
+        WORSE = new < old if higher_is_better else new > old
+        return colored(f" ({new - old:+.2f})", "red" if WORSE else "green")
+
+    print(colored("=" * 60, "cyan"))
+    print(colored("  Load Test Results", "cyan", attrs=["bold"]))
+    print(colored("=" * 60, "cyan"))
+    print(f"{'op':<12}{'req':>6}{'ok':>6}{'429':>6}{'err':>6}{'rps':>9}{'p50':>10}{'p99':>10}{'max':>10}")
+
+    BASE_OPS = (baseline or {}).get("operations", {})
+    for NAME, OP in summary["operations"].items():
+        BASE = BASE_OPS.get(NAME, {})
+        ROW = (
+            f"{NAME:<12}{OP['requests']:>6}{OP['ok']:>6}{OP['rejected']:>6}{OP['errors']:>6}"
+            f"{OP['throughput_rps']:>9.2f}"
+        )
+        for KEY in ("p50_ms", "p99_ms", "max_ms"):
+            ROW += f"{OP[KEY] if OP[KEY] is not None else '-':>10}"
+        print(ROW)
+        if BASE:
+            print(
+                "  vs base:"
+                + _delta(OP["throughput_rps"], BASE.get("throughput_rps"), higher_is_better=True)
+                + " rps"
+                + _delta(OP["p99_ms"], BASE.get("p99_ms"))
+                + " p99 ms"
+            )
+
+    LAG = summary["event_loop_lag"]
+    BASE_LAG = (baseline or {}).get("event_loop_lag", {})
+    print(
+        f"event-loop lag: p50={LAG['p50_ms']}ms p99={LAG['p99_ms']}ms max={LAG['max_ms']}ms"
+        + _delta(LAG["p99_ms"], BASE_LAG.get("p99_ms"))
+    )
+
+
+def _git_revision() -> Optional[str]:
+    """Current commit (with a -dirty suffix for uncommitted changes), if in git."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(summary: dict, args) -> str:
+    """Write results plus run config to the output directory; return the path."""
+    REVISION = _git_revision()
+    TIMESTAMP = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    os.makedirs(args.output_dir, exist_ok=True)
+    PATH = os.path.join(args.output_dir, f"{TIMESTAMP}_{REVISION or 'nogit'}.json")
+
+    CONFIG = {
+        KEY: VALUE for KEY, VALUE in vars(args).items()
+        if KEY not in ("output_dir", "compare", "verbose")
+    }
+    with open(PATH, "w", encoding="utf-8") as f:
+        json.dump({
+            "revision": REVISION,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": CONFIG,
+            **summary,
+        }, f, indent=2)
+    return PATH
+
+
+# ── Entry Point ──────────────────────────────────────────────────
+
+
+def parse_args() -> argparse.Namespace:
+    PARSER = argparse.ArgumentParser(description=__doc__.split("\n\n")[1].strip())
+    PARSER.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic to drive")
+    PARSER.add_argument("--latency", type=float, default=0.5, help="Mean fake inference latency (s)")
+    PARSER.add_argument("--jitter", type=float, default=0.0, help="Latency spread (s); stddev for normal/lognormal")
+    PARSER.add_argument(
+        "--distribution", default="fixed",
+        choices=["fixed", "uniform", "normal", "lognormal"],
+        help="Fake inference latency distribution",
+    )
+    PARSER.add_argument("--size", type=int, default=64, help="Generated image width/height in pixels")
+    PARSER.add_argument("--generate-clients", type=int, default=2, help="Concurrent REST generate clients")
+    PARSER.add_argument("--poll-clients", type=int, default=8, help="Concurrent /api/images pollers")
+    PARSER.add_argument("--fetch-clients", type=int, default=4, help="Concurrent image fetch clients")
+    PARSER.add_argument("--mcp-clients", type=int, default=2, help="Concurrent MCP generate_image clients")
+    PARSER.add_argument("--batch-clients", type=int, default=0, help="Concurrent REST /api/generate/batch clients")
+    PARSER.add_argument("--mcp-batch-clients", type=int, default=0, help="Concurrent MCP generate_images clients")
+    PARSER.add_argument("--batch-size", type=int, default=4, help="Images per batch request")
+    PARSER.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between gallery polls")
+    PARSER.add_argument("--fetch-interval", type=float, default=0.2, help="Seconds between image fetches")
+    PARSER.add_argument("--retry-interval", type=float, default=0.5, help="Back-off after a rejected generate")
+    PARSER.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (s)")
+    PARSER.add_argument("--verbose", action="store_true", help="Show server output while traffic runs")
+    PARSER.add_argument("--output-dir", default=RESULTS_DIR, help="Where to save result JSON files")
+    PARSER.add_argument("--compare", help="Previous result JSON to compare against")
+    return PARSER.parse_args()
+
+
+def main() -> None:
+    ARGS = parse_args()
+    # Per-request client/session logs would drown out the report
+    for NAME in ("httpx", "mcp"):
+        logging.getLogger(NAME).setLevel(logging.WARNING)
+    install_fake_pipeline(ARGS.latency, ARGS.jitter, ARGS.distribution)
+
+    # Always use a throwaway directory so fake images never reach the real
+    # gallery, even when OUTPUT_DIR is set (e.g. by docker-compose)
+    SETTINGS.OUTPUT_DIR = tempfile.mkdtemp(prefix="zimage_loadtest_")
+
+    PORT = _free_port()
+    print(colored(
+        f"[LoadTest] Server on port {PORT}, output dir {SETTINGS.OUTPUT_DIR}, "
+        f"{ARGS.duration}s of traffic",
+        "yellow",
+    ))
+
+    with contextlib.ExitStack() as STACK:
+        STACK.callback(shutil.rmtree, SETTINGS.OUTPUT_DIR, ignore_errors=True)
+        if not ARGS.verbose:
+            # The server thread shares sys.stdout, so this also silences its per-image prints
+            DEVNULL = STACK.enter_context(open(os.devnull, "w", encoding="utf-8"))
+            STACK.enter_context(contextlib.redirect_stdout(DEVNULL))
+        SERVER = ServerThread(PORT)
+        SERVER.start()
+        SERVER.wait_started()
+        try:
+            SERVER.sampling = True
+            RECORDER, WALL_TIME = asyncio.run(run_traffic(f"http://127.0.0.1:{PORT}", ARGS))
+            SERVER.sampling = False
+        finally:
+            SERVER.stop()
+
+    SUMMARY = summarize(RECORDER, SERVER.lag_samples, WALL_TIME)
+    BASELINE = None
+    if ARGS.compare:
+        with open(ARGS.compare, "r", encoding="utf-8") as f:
+            BASELINE = json.load(f)
+
+    print_report(SUMMARY, BASELINE)
+    PATH = save_results(SUMMARY, ARGS)
+    print(colored(f"[LoadTest] Results saved to {PATH}", "green", attrs=["bold"]))
+
+
+if __name__ == "__main__":
+    main()
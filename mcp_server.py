@@ -4,9 +4,17 @@ Mounted on FastAPI at /mcp using Streamable HTTP transport.
 Agents (Cursor, Claude, etc.) can connect to generate images programmatically.
 """
 
-from mcp.server.fastmcp import FastMCP
+from typing import Optional
+
+from mcp.server.fastmcp import Context, FastMCP
 from mcp.server.transport_security import TransportSecuritySettings
 
+from services.image_generator import (
+    GenerationBusyError,
+    expand_batch,
+    start_batch,
+    submit_exclusive,
+)
 from services.image_generator import generate_image as _generate
 from services.model_manager import MODEL_MANAGER
 
@@ -22,7 +30,8 @@ MCP = FastMCP(
     name="Z-Image Generator",
     instructions=(
         "Z-Image Generator MCP server. "
-        "Use the generate_image tool to create images from text prompts. "
+        "Use the generate_image tool to create images from text prompts, "
+        "or generate_images to get several candidates (seeds or prompts) in one call. "
         "It is good for generating small profile pictures at 512x512 "
         "but also capable of highly realistic 1024x1024 images. "
         "You should specify a style with each prompt (e.g. photo, illustration, painting). "
@@ -62,19 +71,71 @@ async def generate_image(
         return json.dumps({"error": "Model is not loaded yet. Please wait."})
 
     try:
-        LOOP = asyncio.get_running_loop()
-        RESULT = await LOOP.run_in_executor(
-            None,
-            partial(
-                _generate,
-                prompt=prompt,
-                width=width,
-                height=height,
-                steps=steps,
-                seed=seed,
-            ),
-        )
+        FUTURE = await submit_exclusive(partial(
+            _generate,
+            prompt=prompt,
+            width=width,
+            height=height,
+            steps=steps,
+            seed=seed,
+        ))
+        RESULT = await asyncio.shield(FUTURE)
         RESULT["url"] = f"/api/images/{RESULT['filename']}"
         return json.dumps(RESULT, indent=2)
+    except GenerationBusyError as e:
+        return json.dumps({"error": str(e), "busy": True})
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+
+@MCP.tool()
+async def generate_images(
+    ctx: Context,
+    prompt: str = "",
+    prompts: Optional[list[str]] = None,
+    seeds: Optional[list[int]] = None,
+    count: int = 0,
+    width: int = 512,
+    height: int = 512,
+    steps: int = 0,
+) -> str:
+    """
+    Generate several images in one call: variations of one prompt or a list of prompts.
+    Each distinct prompt is encoded only once, so this is faster than repeated
+    generate_image calls. Progress is reported as each image finishes.
+
+    Args:
+        prompt: A detailed text description to generate variations of.
+        prompts: Alternatively, a list of prompts (one image each). Do not combine with prompt.
+        seeds: Seeds to use (-1 = random). With prompt, sets the number of variations;
+            with prompts, must have one seed per prompt.
+        count: Number of random-seed variations of prompt. Use 0 for default (4).
+            Do not combine with prompts or seeds.
+        width: Image width in pixels. Recommended: 512 or 1024.
+        height: Image height in pixels. Recommended: 512 or 1024.
+        steps: Number of inference steps. Use 0 for default (9).
+
+    Returns:
+        JSON string with the individual images and a grid composite URL.
+    """
+    import json
+
+    if not MODEL_MANAGER.is_loaded:
+        return json.dumps({"error": "Model is not loaded yet. Please wait."})
+
+    try:
+        JOBS = expand_batch(prompt=prompt, prompts=prompts, seeds=seeds, count=count)
+        EVENTS = await start_batch(JOBS, width=width, height=height, steps=steps)
+        async for EVENT in EVENTS:
+            if EVENT["type"] == "item":
+                await ctx.report_progress(
+                    EVENT["index"] + 1,
+                    len(JOBS),
+                    message=f"Generated {EVENT['url']}",
+                )
+        EVENT.pop("type")
+        return json.dumps(EVENT, indent=2)
+    except GenerationBusyError as e:
+        return json.dumps({"error": str(e), "busy": True})
     except Exception as e:
         return json.dumps({"error": str(e)})
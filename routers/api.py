@@ -3,24 +3,29 @@ REST API routes for image generation, image listing, status, and config.
 """
 
 import asyncio
+import json
 import os
 from functools import partial
-from typing import Optional
+from typing import Annotated, Optional
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 from config import SETTINGS
-from services.image_generator import generate_image, list_images
+from services.image_generator import (
+    GenerationBusyError,
+    expand_batch,
+    generate_image,
+    list_images,
+    start_batch,
+    submit_exclusive,
+)
 from services.model_manager import MODEL_MANAGER
 
 
 ROUTER = APIRouter(prefix="/api", tags=["Image Generation API"])
 
-# Only allow one generation at a time – CPU can't parallelise inference
-_GENERATION_LOCK = asyncio.Lock()
-
 
 # ── Request / Response Models ────────────────────────────────────
 
@@ -49,6 +54,17 @@ class GenerateResponse(BaseModel):
     model: str
 
 
+class GenerateBatchRequest(BaseModel):
+    """Request body for batch / variation generation."""
+    prompt: Optional[str] = Field(None, min_length=1, max_length=2000, description="Single prompt to generate variations of. Mutually exclusive with `prompts`.")
+    prompts: Optional[list[Annotated[str, Field(min_length=1, max_length=2000)]]] = Field(None, min_length=1, description="List of prompts, one image per prompt. Mutually exclusive with `prompt`.")
+    seeds: Optional[list[Annotated[int, Field(ge=-1, lt=2**63)]]] = Field(None, min_length=1, description="Seeds (-1 = random). With `prompt` sets the number of variations; with `prompts` must match its length.")
+    count: int = Field(0, ge=0, description="Number of random-seed variations of `prompt`. 0 uses 4. Cannot be combined with `prompts` or `seeds`.")
+    width: int = Field(0, ge=0, le=2048, description="Image width in pixels. 0 uses server default (512).")
+    height: int = Field(0, ge=0, le=2048, description="Image height in pixels. 0 uses server default (512).")
+    steps: int = Field(0, ge=0, le=100, description="Number of inference steps. 0 uses server default (9).")
+
+
 class StatusResponse(BaseModel):
     """Model status response."""
     is_loaded: bool
@@ -94,30 +110,79 @@ async def api_generate(request: GenerateRequest):
             detail="Model is not loaded yet. Please wait.",
         )
 
-    if _GENERATION_LOCK.locked():
+    try:
+        FUTURE = await submit_exclusive(partial(
+            generate_image,
+            prompt=request.prompt,
+            width=request.width,
+            height=request.height,
+            steps=request.steps,
+            seed=request.seed,
+        ))
+    except GenerationBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    try:
+        RESULT = await asyncio.shield(FUTURE)
+        RESULT["url"] = f"/api/images/{RESULT['filename']}"
+        return GenerateResponse(**RESULT)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@ROUTER.post(
+    "/generate/batch",
+    summary="Generate a batch of images (variations or multiple prompts)",
+    description=(
+        "Generate several images in one request: either one `prompt` with N seeds, "
+        "or a list of `prompts`. Each distinct prompt is encoded only once. "
+        "The batch holds the generation slot as one unit (429 if busy). "
+        "Streams newline-delimited JSON: one `item` event per finished image, "
+        "then a `done` event with all items and a grid composite."
+    ),
+    responses={
+        200: {"content": {"application/x-ndjson": {}}},
+        422: {"description": "Invalid prompt/seed combination or batch too large"},
+        429: {"description": "Another generation is already in progress"},
+        503: {"description": "Model is still loading"},
+    },
+)
+async def api_generate_batch(request: GenerateBatchRequest):
+    """Generate a batch of images and stream results as they finish."""
+    try:
+        JOBS = expand_batch(
+            prompt=request.prompt,
+            prompts=request.prompts,
+            seeds=request.seeds,
+            count=request.count,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if not MODEL_MANAGER.is_loaded:
         raise HTTPException(
-            status_code=429,
-            detail="Another image is currently being generated. Please wait.",
+            status_code=503,
+            detail="Model is not loaded yet. Please wait.",
         )
 
-    async with _GENERATION_LOCK:
+    try:
+        EVENTS = await start_batch(
+            JOBS,
+            width=request.width,
+            height=request.height,
+            steps=request.steps,
+        )
+    except GenerationBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    async def _events():
         try:
-            LOOP = asyncio.get_running_loop()
-            RESULT = await LOOP.run_in_executor(
-                None,
-                partial(
-                    generate_image,
-                    prompt=request.prompt,
-                    width=request.width,
-                    height=request.height,
-                    steps=request.steps,
-                    seed=request.seed,
-                ),
-            )
-            RESULT["url"] = f"/api/images/{RESULT['filename']}"
-            return GenerateResponse(**RESULT)
+            async for EVENT in EVENTS:
+                yield json.dumps(EVENT) + "\n"
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
 
 
 @ROUTER.get("/images")
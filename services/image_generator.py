@@ -3,20 +3,81 @@ Image Generator: handles image generation requests using the loaded pipeline.
 Saves images with UUID filenames and JSON metadata sidecars.
 """
 
+import asyncio
 import json
+import math
 import os
 import time
 import uuid
 from datetime import datetime, timezone
-from typing import Optional
+from typing import AsyncIterator, Callable, Optional
 
 import torch
+from PIL import Image
 from termcolor import colored
 
 from config import SETTINGS
 from services.model_manager import MODEL_MANAGER
 
 
+# Only allow one generation at a time – CPU can't parallelise inference
+GENERATION_LOCK = asyncio.Lock()
+
+
+class GenerationBusyError(RuntimeError):
+    """Raised when a generation is requested while another is in progress."""
+
+
+def _resolve_seed(seed: int) -> int:
+    """Return the given seed, or a random one if it is negative."""
+    return seed if seed >= 0 else int.from_bytes(os.urandom(4), "big") % (2**31)
+
+
+def _save_image(
+    image: Image.Image,
+    prompt: str,
+    width: int,
+    height: int,
+    steps: int,
+    seed: int,
+    elapsed: float,
+    extra: Optional[dict] = None,
+) -> dict:
+    """
+    Save a generated image and its JSON metadata sidecar.
+
+    Returns:
+        The metadata dictionary written to the sidecar.
+    """
+    IMAGE_ID = str(uuid.uuid4())[:12]
+    TIMESTAMP = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    FILENAME = f"{TIMESTAMP}_{IMAGE_ID}.png"
+    FILEPATH = os.path.join(SETTINGS.OUTPUT_DIR, FILENAME)
+
+    os.makedirs(SETTINGS.OUTPUT_DIR, exist_ok=True)
+    image.save(FILEPATH)
+
+    METADATA = {
+        "filename": FILENAME,
+        "prompt": prompt,
+        "width": width,
+        "height": height,
+        "steps": steps,
+        "seed": seed,
+        "guidance_scale": SETTINGS.DEFAULT_GUIDANCE_SCALE,
+        "generation_time_seconds": elapsed,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "model": SETTINGS.MODEL_REPO_ID,
+        **(extra or {}),
+    }
+
+    META_PATH = os.path.join(SETTINGS.OUTPUT_DIR, f"{FILENAME}.json")
+    with open(META_PATH, "w", encoding="utf-8") as f:
+        json.dump(METADATA, f, indent=2, ensure_ascii=False)
+
+    return METADATA
+
+
 def generate_image(
     prompt: str,
     width: int = 0,
@@ -41,7 +102,7 @@ def generate_image(
     WIDTH = width if width > 0 else SETTINGS.DEFAULT_WIDTH
     HEIGHT = height if height > 0 else SETTINGS.DEFAULT_HEIGHT
     STEPS = steps if steps > 0 else SETTINGS.DEFAULT_STEPS
-    SEED = seed if seed >= 0 else int.from_bytes(os.urandom(4), "big") % (2**31)
+    SEED = _resolve_seed(seed)
 
     print(colored(
         f"[Generator] Generating: {WIDTH}x{HEIGHT}, {STEPS} steps, seed={SEED}",
@@ -67,39 +128,274 @@ def generate_image(
     IMAGE = RESULT.images[0]
     ELAPSED = round(time.time() - START_TIME, 2)
 
-    # Save image
-    IMAGE_ID = str(uuid.uuid4())[:12]
-    TIMESTAMP = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    FILENAME = f"{TIMESTAMP}_{IMAGE_ID}.png"
-    FILEPATH = os.path.join(SETTINGS.OUTPUT_DIR, FILENAME)
+    METADATA = _save_image(
+        IMAGE,
+        prompt=prompt,
+        width=WIDTH,
+        height=HEIGHT,
+        steps=STEPS,
+        seed=SEED,
+        elapsed=ELAPSED,
+    )
 
-    os.makedirs(SETTINGS.OUTPUT_DIR, exist_ok=True)
-    IMAGE.save(FILEPATH)
+    print(colored(
+        f"[Generator] Done in {ELAPSED}s -> {METADATA['filename']}",
+        "green", attrs=["bold"],
+    ))
 
-    # Save metadata sidecar
-    METADATA = {
-        "filename": FILENAME,
-        "prompt": prompt,
-        "width": WIDTH,
-        "height": HEIGHT,
-        "steps": STEPS,
-        "seed": SEED,
-        "guidance_scale": SETTINGS.DEFAULT_GUIDANCE_SCALE,
-        "generation_time_seconds": ELAPSED,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "model": SETTINGS.MODEL_REPO_ID,
-    }
+    return METADATA
 
-    META_PATH = os.path.join(SETTINGS.OUTPUT_DIR, f"{FILENAME}.json")
-    with open(META_PATH, "w", encoding="utf-8") as f:
-        json.dump(METADATA, f, indent=2, ensure_ascii=False)
 
+def expand_batch(
+    prompt: Optional[str] = None,
+    prompts: Optional[list[str]] = None,
+    seeds: Optional[list[int]] = None,
+    count: int = 0,
+) -> list[tuple[str, int]]:
+    """
+    Expand a batch request into (prompt, seed) pairs.
+
+    Either one prompt with several seeds (variations), or a list of prompts
+    with one seed each. `count` only applies to a single prompt without
+    explicit seeds. Raises ValueError for an invalid combination.
+
+    Args:
+        prompt: Single prompt to generate variations of.
+        prompts: List of prompts, one image per prompt.
+        seeds: Explicit seeds (-1 = random). For a single prompt this sets the
+            number of variations; for a prompt list it must match its length.
+        count: Number of variations when no seeds are given (0 = 4).
+
+    Returns:
+        List of (prompt, seed) tuples in generation order.
+    """
+    if not prompt and not prompts:
+        raise ValueError("Provide either 'prompt' or 'prompts'.")
+    if prompt and prompts:
+        raise ValueError("Provide either 'prompt' or 'prompts', not both.")
+    if count and (prompts or seeds):
+        raise ValueError("'count' cannot be combined with 'prompts' or 'seeds'.")
+    if prompts and not all(1 <= len(P) <= 2000 for P in prompts):
+        raise ValueError("Each prompt must be 1-2000 characters.")
+    if seeds and not all(-1 <= S < 2**63 for S in seeds):
+        raise ValueError("Each seed must be -1 (random) or between 0 and 2**63 - 1.")
+
+    if prompts:
+        if seeds and len(seeds) != len(prompts):
+            raise ValueError("'seeds' must have one entry per prompt.")
+        JOBS = list(zip(prompts, seeds or [-1] * len(prompts)))
+    else:
+        JOBS = [(prompt, SEED) for SEED in (seeds or [-1] * (count or 4))]
+
+    if len(JOBS) > SETTINGS.MAX_BATCH_SIZE:
+        raise ValueError(
+            f"Batch too large: {len(JOBS)} images (max {SETTINGS.MAX_BATCH_SIZE})."
+        )
+
+    return JOBS
+
+
+def _encode_prompt(pipeline, prompt: str):
+    """Encode a prompt once so its embeddings can be reused across seeds."""
+    with torch.inference_mode():
+        PROMPT_EMBEDS, _ = pipeline.encode_prompt(
+            prompt=prompt,
+            device=pipeline.device,
+            do_classifier_free_guidance=False,
+        )
+    return PROMPT_EMBEDS
+
+
+def _make_grid(images: list[Image.Image]) -> tuple[Image.Image, int, int]:
+    """Compose images into a near-square contact sheet."""
+    COLUMNS = math.ceil(math.sqrt(len(images)))
+    ROWS = math.ceil(len(images) / COLUMNS)
+    CELL_W = max(IMG.width for IMG in images)
+    CELL_H = max(IMG.height for IMG in images)
+
+    GRID = Image.new("RGB", (COLUMNS * CELL_W, ROWS * CELL_H))
+    for INDEX, IMG in enumerate(images):
+        GRID.paste(IMG, ((INDEX % COLUMNS) * CELL_W, (INDEX // COLUMNS) * CELL_H))
+
+    return GRID, COLUMNS, ROWS
+
+
+def generate_batch(
+    jobs: list[tuple[str, int]],
+    width: int = 0,
+    height: int = 0,
+    steps: int = 0,
+    on_item: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Generate a batch of images, encoding each distinct prompt only once.
+
+    Args:
+        jobs: (prompt, seed) pairs, as returned by expand_batch().
+        width: Image width in pixels (0 = use default).
+        height: Image height in pixels (0 = use default).
+        steps: Number of inference steps (0 = use default).
+        on_item: Called with each item's metadata as soon as it is saved.
+
+    Returns:
+        Dictionary with the batch id, individual items and the grid composite.
+    """
+    WIDTH = width if width > 0 else SETTINGS.DEFAULT_WIDTH
+    HEIGHT = height if height > 0 else SETTINGS.DEFAULT_HEIGHT
+    STEPS = steps if steps > 0 else SETTINGS.DEFAULT_STEPS
+    BATCH_ID = str(uuid.uuid4())[:12]
+
+    print(colored(
+        f"[Generator] Batch {BATCH_ID}: {len(jobs)} images, "
+        f"{len({PROMPT for PROMPT, _ in jobs})} distinct prompts, "
+        f"{WIDTH}x{HEIGHT}, {STEPS} steps",
+        "yellow",
+    ))
+
+    BATCH_START = time.time()
+    PIPELINE = MODEL_MANAGER.pipeline
+    EMBEDS_CACHE: dict[str, object] = {}
+    IMAGES: list[Image.Image] = []
+    ITEMS: list[dict] = []
+
+    for INDEX, (PROMPT, SEED) in enumerate(jobs):
+        SEED = _resolve_seed(SEED)
+        START_TIME = time.time()
+
+        if PROMPT not in EMBEDS_CACHE:
+            EMBEDS_CACHE[PROMPT] = _encode_prompt(PIPELINE, PROMPT)
+
+        RESULT = PIPELINE(
+            prompt_embeds=EMBEDS_CACHE[PROMPT],
+            height=HEIGHT,
+            width=WIDTH,
+            num_inference_steps=STEPS,
+            guidance_scale=SETTINGS.DEFAULT_GUIDANCE_SCALE,
+            generator=torch.Generator("cpu").manual_seed(SEED),
+        )
+
+        IMAGE = RESULT.images[0]
+        METADATA = _save_image(
+            IMAGE,
+            prompt=PROMPT,
+            width=WIDTH,
+            height=HEIGHT,
+            steps=STEPS,
+            seed=SEED,
+            elapsed=round(time.time() - START_TIME, 2),
+            extra={"batch_id": BATCH_ID, "index": INDEX},
+        )
+        METADATA["url"] = f"/api/images/{METADATA['filename']}"
+        IMAGES.append(IMAGE)
+        ITEMS.append(METADATA)
+
+        print(colored(
+            f"[Generator] Batch {BATCH_ID}: {INDEX + 1}/{len(jobs)} "
+            f"done in {METADATA['generation_time_seconds']}s",
+            "green",
+        ))
+        if on_item is not None:
+            on_item(METADATA)
+
+    # Grid has no metadata sidecar, so it stays out of the gallery listing
+    GRID, COLUMNS, ROWS = _make_grid(IMAGES)
+    GRID_FILENAME = f"{ITEMS[0]['filename'][:-len('.png')]}_grid.png"
+    GRID.save(os.path.join(SETTINGS.OUTPUT_DIR, GRID_FILENAME))
+
+    ELAPSED = round(time.time() - BATCH_START, 2)
     print(colored(
-        f"[Generator] Done in {ELAPSED}s -> {FILENAME}",
+        f"[Generator] Batch {BATCH_ID} done in {ELAPSED}s -> {GRID_FILENAME}",
         "green", attrs=["bold"],
     ))
 
-    return METADATA
+    return {
+        "batch_id": BATCH_ID,
+        "items": ITEMS,
+        "grid": {
+            "filename": GRID_FILENAME,
+            "url": f"/api/images/{GRID_FILENAME}",
+            "columns": COLUMNS,
+            "rows": ROWS,
+        },
+        "generation_time_seconds": ELAPSED,
+    }
+
+
+def _release_generation_lock(future: asyncio.Future) -> None:
+    """Done-callback: free the lock and log failures nobody else will see."""
+    GENERATION_LOCK.release()
+    if not future.cancelled() and future.exception() is not None:
+        print(colored(
+            f"[Generator] Generation failed: {future.exception()}",
+            "red", attrs=["bold"],
+        ))
+
+
+async def submit_exclusive(func: Callable[[], object]) -> asyncio.Future:
+    """
+    Claim the generation lock and run func in the default executor.
+
+    The lock is released by the future's done-callback, so it stays held
+    until inference finishes even if the awaiting request is cancelled.
+    Await the result through asyncio.shield() so cancellation cannot
+    cancel the future itself.
+
+    Raises:
+        GenerationBusyError: Another generation already holds the lock.
+    """
+    if GENERATION_LOCK.locked():
+        raise GenerationBusyError(
+            "Another image is currently being generated. Please wait."
+        )
+    # Uncontended acquire does not yield, so nothing can slip in after the check
+    await GENERATION_LOCK.acquire()
+
+    try:
+        FUTURE = asyncio.get_running_loop().run_in_executor(None, func)
+    except BaseException:
+        GENERATION_LOCK.release()
+        raise
+    FUTURE.add_done_callback(_release_generation_lock)
+    return FUTURE
+
+
+async def start_batch(
+    jobs: list[tuple[str, int]],
+    width: int = 0,
+    height: int = 0,
+    steps: int = 0,
+) -> AsyncIterator[dict]:
+    """
+    Submit generate_batch() as one exclusive executor job (see submit_exclusive).
+
+    Returns:
+        Async iterator yielding an "item" event per finished image, then a
+        "done" event with the full batch result.
+
+    Raises:
+        GenerationBusyError: Another generation already holds the lock.
+    """
+    LOOP = asyncio.get_running_loop()
+    QUEUE: asyncio.Queue = asyncio.Queue()
+
+    def _emit(item: Optional[dict]) -> None:
+        LOOP.call_soon_threadsafe(QUEUE.put_nowait, item)
+
+    def _run() -> dict:
+        try:
+            return generate_batch(jobs, width, height, steps, on_item=_emit)
+        finally:
+            _emit(None)
+
+    FUTURE = await submit_exclusive(_run)
+
+    async def _events() -> AsyncIterator[dict]:
+        while (ITEM := await QUEUE.get()) is not None:
+            yield {"type": "item", **ITEM}
+        # Shielded: cancelling the consumer must not cancel the job's future
+        yield {"type": "done", **await asyncio.shield(FUTURE)}
+
+    return _events()
 
 
 def list_images(limit: Optional[int] = None) -> list[dict]: